@@ -1,9 +1,63 @@
 import tensorflow as tf
 import numpy as np
-from numpy.random import uniform
 from . import utils
 
 
+_fitness_cache = {}
+
+
+def _make_fitness_fn(loss_op, num_w, use_grads):
+    """Builds (or fetches) the traced fitness function for a given `loss_op`.
+    The traced functions are cached at module level keyed by the loss, the
+    network depth and whether gradients are needed, so pso instances created
+    with the same fitness (e.g. across a hyperparameter sweep) reuse the same
+    traces instead of growing the graph with every construction.
+    Args:
+        loss_op (function): The user loss evaluating the batched weights and biases.
+        num_w (int): The number of weight tensors of the networks.
+        use_grads (bool): Whether `loss_op` also returns gradients.
+    Returns:
+        function: The fitness function over the per-layer swarm tensors, returning the losses and gradients for all particles. The gradients are an empty tuple on the gradient-free path.
+    """
+    key = (id(loss_op), num_w, use_grads)
+    fitness = _fitness_cache.get(key)
+    if fitness is None:
+        if use_grads:
+
+            def fitness(x):
+                f_x, grads = loss_op(x[:num_w], x[num_w:])
+                return f_x[:, None], grads
+
+        else:
+
+            def fitness(x):
+                f_x = loss_op(x[:num_w], x[num_w:])
+                return f_x[:, None], ()
+
+        fitness = tf.function(fitness, jit_compile=True, reduce_retracing=True)
+        _fitness_cache[key] = fitness
+    return fitness
+
+
+def _eval_loss_chunk(loss_op, w, b, use_grads):
+    """Evaluates `loss_op` on one population chunk and converts the results
+    to NumPy on the worker side, so they can cross a process boundary on the
+    way back just like the chunks did on the way in. Used as the executor job
+    by `_fitness_parallel`.
+    Args:
+        loss_op (function): The user loss evaluating the batched weights and biases.
+        w (list): The chunk's batched weights, as NumPy arrays.
+        b (list): The chunk's batched biases, as NumPy arrays.
+        use_grads (bool): Whether `loss_op` also returns gradients.
+    Returns:
+        The per-particle losses as a NumPy array, followed by the gradients as NumPy arrays when `use_grads` is set.
+    """
+    if not use_grads:
+        return np.asarray(loss_op(w, b))
+    f_x, grads = loss_op(w, b)
+    return np.asarray(f_x), [np.asarray(g_l) for g_l in grads]
+
+
 class pso:
     def __init__(
         self,
@@ -19,11 +73,14 @@ class pso:
         gd_alpha=0.00,
         cold_start=True,
         initialization_method=None,
+        executor=None,
+        ncores=1,
+        seed=None,
         verbose=False,
     ):
         """The Particle Swarm Optimizer class. Specially built to deal with tensorflow neural networks.
         Args:
-            loss_op (function): The fitness function for PSO.
+            loss_op (function): The fitness function for PSO. It receives the batched weights and biases of the whole swarm (population as the leading dimension) and returns the per-particle losses and gradients. When `gd_alpha` is 0 it must return only the losses, so no backward pass is ever built.
             layer_sizes (list): The layers sizes of the neural net.
             n_iter (int, optional): Number of PSO iterations. Defaults to 2000.
             pop_size (int, optional): Population of the PSO swarm. Defaults to 30.
@@ -35,6 +92,9 @@ class pso:
             gd_alpha (float, optional): Learning rate for gradient descent. Defaults to 0.00, so there wouldn't have any gradient-based optimization.
             cold_start (bool, optional): Set the starting velocities to 0. Defaults to True.
             initialization_method (_type_, optional): Chooses how to initialize the Neural Net weights. Allowed to be one of "uniform", "xavier", or "log_logistic". Defaults to None, where it uses uniform initialization.
+            executor (concurrent.futures.Executor, optional): Executor used to evaluate the fitness of population chunks in parallel. Thread pools parallelize because TF kernels release the GIL; process pools additionally require `loss_op` to be a picklable module-level function (the chunks and the results cross as NumPy arrays). Only worth it when `loss_op` is expensive; for cheap losses the in-graph batched path is faster. Defaults to None.
+            ncores (int, optional): Number of population chunks dispatched to the executor. Ignored when `executor` is None. Defaults to 1.
+            seed (int, optional): Seed for the generator drawing the step randoms, making the optimization reproducible. Defaults to None, where the generator starts from a non-deterministic state.
             verbose (bool, optional): Shows info during the training . Defaults to False.
         """
         self.loss_op = loss_op
@@ -48,124 +108,268 @@ class pso:
         self.x_min = x_min
         self.x_max = x_max
         self.initialization_method = initialization_method
-        self.x = self.build_swarm()
-        self.p = self.x
-        self.loss_history = []
-        self.f_p, self.grads = self.fitness_fn(self.p)
-        self.g = self.p[tf.math.argmin(input=self.f_p).numpy()[0]]
         self.gd_alpha = gd_alpha
         self.cold_start = cold_start
-        self.v = self.start_velocities()
+        self.executor = executor
+        self.ncores = ncores
+        self.fitness_fn = (
+            _make_fitness_fn(loss_op, len(layer_sizes) - 1, gd_alpha != 0)
+            if executor is None
+            else None
+        )
+        gpus = tf.config.list_logical_devices("GPU")
+        self.device = gpus[0].name if gpus else "/CPU:0"
+        with tf.device(self.device):
+            self._rng = (
+                tf.random.Generator.from_seed(seed)
+                if seed is not None
+                else tf.random.Generator.from_non_deterministic_state()
+            )
+            self.x = [
+                tf.Variable(x_l, trainable=False) for x_l in self.build_swarm()
+            ]
+            self.p = [tf.Variable(x_l, trainable=False) for x_l in self.x]
+            if self.executor is None:
+                f_p, grads = self.fitness_fn(self.p)
+            else:
+                f_p, grads = self._fitness_parallel(self.p)
+            self.f_p = tf.Variable(f_p, trainable=False)
+            self.grads = [tf.Variable(g_l, trainable=False) for g_l in grads]
+            best = tf.argmin(tf.squeeze(f_p, axis=1), output_type=tf.int32)
+            self.g = [
+                tf.Variable(tf.gather(p_l, best), trainable=False) for p_l in self.p
+            ]
+            self.v = [
+                tf.Variable(v_l, trainable=False) for v_l in self.start_velocities()
+            ]
+        self.loss_history = []
         self.verbose = verbose
         self.name = "PSO" if self.gd_alpha == 0 else "PSO-GD"
 
     def build_swarm(self):
-        """Creates the swarm following the selected initialization method.
+        """Creates the swarm following the selected initialization method. The
+        swarm is kept in structure-of-arrays form: one batched tensor per layer
+        weight and bias, each with the population as its leading dimension.
         Args:
             initialization_method (str): Chooses how to initialize the Neural Net weights. Allowed to be one of "uniform", "xavier", or "log_logistic". Defaults to None, where it uses uniform initialization.
         Returns:
-            tf.Tensor: The PSO swarm population. Each particle represents a neural network.
+            list: The PSO swarm population as per-layer tensors. Each particle represents a neural network.
         """
-        return utils.build_NN(
+        flat = utils.build_NN(
             self.pop_size, self.layer_sizes, self.initialization_method
         )
+        w, b = utils.decode_batch(flat, self.layer_sizes)
+        return w + b
 
     def start_velocities(self):
         """Start the velocities of each particle in the population (swarm). If 'self.cold_start' is 'TRUE', the swarm starts with velocity 0, which means stopped.
         Returns:
-            tf.Tensor: The starting velocities.
+            list: The starting velocities, one tensor per layer tensor.
         """
         if self.cold_start:
-            return tf.zeros([self.pop_size, self.dim])
+            return [tf.zeros_like(x_l) for x_l in self.x]
         else:
-            return tf.Variable(
+            return [
                 tf.random.uniform(
-                    [self.pop_size, self.dim],
+                    x_l.shape,
                     -self.x_max - self.x_min,
                     self.x_max - self.x_min,
                 )
-            )
-
-    def individual_fn(self, particle):
-        """Auxiliary function to get the loss of each particle.
-        Args:
-            particle (tf.Tensor): One particle of the PSO swarm representing a full neural network.
-        Returns:
-            tuple: The loss value and the gradients.
-        """
-        w, b = utils.decode(particle, self.layer_sizes)
-        loss, grad = self.loss_op(w, b)
-        return loss, utils.flat_grad(grad)
+                for x_l in self.x
+            ]
 
-    @tf.function
-    def fitness_fn(self, x):
-        """Fitness function for the whole swarm.
+    def _fitness_parallel(self, x):
+        """Fitness function that splits the population into `ncores` chunks
+        and evaluates `loss_op` on each chunk through the executor. The chunks
+        are handed over as NumPy arrays and the results come back as NumPy
+        arrays (converted on the worker via `_eval_loss_chunk`), so both legs
+        can cross process boundaries; TF ops inside `loss_op` convert the
+        inputs back implicitly. Runs eagerly; only pays off when `loss_op` is
+        expensive enough to amortize the dispatch.
         Args:
-            x (tf.Tensor): The swarm. All the particle's current positions. Which means the weights of all neural networks.
+            x (list): The swarm. All the particle's current positions, as per-layer tensors.
         Returns:
             tuple: the losses and gradients for all particles.
         """
-        f_x, grads = tf.vectorized_map(self.individual_fn, x)
+        num_w = len(self.layer_sizes) - 1
+        base = self.pop_size // self.ncores
+        sizes = [base + 1] * (self.pop_size % self.ncores) + [base] * (
+            self.ncores - self.pop_size % self.ncores
+        )
+        chunks = [
+            [t.numpy() for t in tf.split(x_l, sizes, axis=0)] for x_l in x
+        ]
+        jobs = [
+            self.executor.submit(
+                _eval_loss_chunk,
+                self.loss_op,
+                [chunks[l][c] for l in range(num_w)],
+                [chunks[l][c] for l in range(num_w, 2 * num_w)],
+                self.gd_alpha != 0,
+            )
+            for c in range(self.ncores)
+        ]
+        results = [job.result() for job in jobs]
+        if self.gd_alpha == 0:
+            return tf.concat(results, axis=0)[:, None], ()
+        f_x = tf.concat([f for f, _ in results], axis=0)
+        grads = [
+            tf.concat([g[l] for _, g in results], axis=0) for l in range(2 * num_w)
+        ]
         return f_x[:, None], grads
 
-    def get_randoms(self):
-        """Generate random values to update the particles' positions.
+    def _step_impl(self, x, v, p, f_p, g, grads, fitness_fn):
+        """The PSO step: the velocity/position update, the fitness evaluation
+        and the *p-best*/*g-best* updates. The swarm state is a list of
+        per-layer tensors, so the per-layer loop below is unrolled into a
+        small, fixed number of batched ops.
+        Args:
+            x (list): The current particle positions, one tensor per layer tensor.
+            v (list): The current particle velocities.
+            p (list): The *p-best* positions.
+            f_p (tf.Tensor): The *p-best* losses.
+            g (list): The *g-best* position.
+            grads (list): The gradients at the current positions. Empty on the gradient-free path.
+            fitness_fn (function): The fitness function evaluating the whole swarm.
         Returns:
-            _type_: _description_
+            tuple: The updated `(x, v, p, f_p, g, grads)` and the mean swarm loss.
         """
-        return uniform(0, 1, [2, self.dim])[:, None]
+        x_new, v_new = [], []
+        for l, (x_l, v_l, p_l, g_l) in enumerate(zip(x, v, p, g)):
+            r = self._rng.uniform([2] + x_l.shape.as_list(), 0.0, 1.0)
+            r1, r2 = r[0], r[1]
+            terms = [
+                self.b * v_l,
+                self.c1 * r1 * (p_l - x_l),
+                self.c2 * r2 * (g_l - x_l),
+            ]
+            if self.gd_alpha != 0:
+                terms.append(-self.gd_alpha * grads[l])
+            v_l_new = tf.add_n(terms)
+            v_new.append(v_l_new)
+            x_new.append(x_l + v_l_new)
+        f_x, grads_new = fitness_fn(x_new)
+        improved = f_x < f_p
+        mask = tf.reshape(improved, [-1, 1, 1])
+        p_new = [tf.where(mask, x_l, p_l) for x_l, p_l in zip(x_new, p)]
+        f_p_new = tf.where(improved, f_x, f_p)
+        best = tf.argmin(tf.squeeze(f_p_new, axis=1), output_type=tf.int32)
+        g_new = [tf.gather(p_l, best) for p_l in p_new]
+        return x_new, v_new, p_new, f_p_new, g_new, grads_new, tf.reduce_mean(f_x)
 
-    def update_p_best(self):
-        """Updates the *p-best* positions."""
-        f_x, self.grads = self.fitness_fn(self.x)
-        self.loss_history.append(tf.reduce_mean(f_x).numpy())
-        self.p = tf.where(f_x < self.f_p, self.x, self.p)
-        self.f_p = tf.where(f_x < self.f_p, f_x, self.f_p)
+    def _assign_state(self, x, v, p, f_p, g, grads):
+        """Writes a step result back into the preallocated state variables, so
+        no fresh state tensors survive the step."""
+        for var, val in zip(self.x, x):
+            var.assign(val)
+        for var, val in zip(self.v, v):
+            var.assign(val)
+        for var, val in zip(self.p, p):
+            var.assign(val)
+        self.f_p.assign(f_p)
+        for var, val in zip(self.g, g):
+            var.assign(val)
+        for var, val in zip(self.grads, grads):
+            var.assign(val)
 
-    def update_g_best(self):
-        """Update the *g-best* position."""
-        self.g = self.p[tf.math.argmin(input=self.f_p).numpy()[0]]
+    @tf.function(jit_compile=True, reduce_retracing=True)
+    def _step_graph(self):
+        """Runs ONE fused PSO step in-place on the state variables. See
+        `_step_impl`.
+        Returns:
+            tf.Tensor: The mean swarm loss.
+        """
+        x, v, p, f_p, g, grads, loss = self._step_impl(
+            self.x, self.v, self.p, self.f_p, self.g, self.grads, self.fitness_fn
+        )
+        self._assign_state(x, v, p, f_p, g, grads)
+        return loss
 
     def step(self):
-        """It runs ONE step on the particle swarm optimization."""
-        r1, r2 = self.get_randoms()
-        self.v = (
-            self.b * self.v
-            + self.c1 * r1 * (self.p - self.x)
-            + self.c2 * r2 * (self.g - self.x)
-            - self.gd_alpha * self.grads
-        )
-        self.x = self.x + self.v
-        self.update_p_best()
-        self.update_g_best()
+        """It runs ONE step on the particle swarm optimization. When an
+        executor is set the step runs eagerly with the chunked parallel
+        fitness, otherwise it runs the fused step graph."""
+        if self.executor is not None:
+            x, v, p, f_p, g, grads, loss = self._step_impl(
+                self.x,
+                self.v,
+                self.p,
+                self.f_p,
+                self.g,
+                self.grads,
+                self._fitness_parallel,
+            )
+            self._assign_state(x, v, p, f_p, g, grads)
+        else:
+            loss = self._step_graph()
+        self.loss_history.append(loss.numpy())
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[], dtype=tf.int32)])
+    def _train_graph(self, n_iter):
+        """Runs `n_iter` PSO steps inside one graph. The iterations live in a
+        single `tf.while_loop` (built by autograph from the `tf.range` loop),
+        each step updating the state variables in place, so there is no Python
+        dispatch between steps and the whole training runs on-device.
+        Args:
+            n_iter (tf.Tensor): Number of PSO iterations, as a scalar tensor.
+        Returns:
+            tf.Tensor: The per-iteration mean losses.
+        """
+        losses = tf.TensorArray(tf.float32, size=n_iter)
+        for i in tf.range(n_iter):
+            losses = losses.write(i, self._step_graph())
+        return losses.stack()
 
     def train(self):
         """The particle swarm optimization. The PSO will optimize the weights according to the losses of the neural network, so this process is actually the neural network training."""
-        for i in range(self.n_iter):
-            self.step()
-            if self.verbose and i % (self.n_iter / 10) == 0:
+        if self.executor is not None:
+            for i in range(self.n_iter):
+                self.step()
+                if self.verbose and i % (self.n_iter / 10) == 0:
+                    utils.progress(
+                        (i / self.n_iter) * 100,
+                        metric="loss",
+                        metricValue=self.loss_history[-1],
+                    )
+            if self.verbose:
+                utils.progress(100)
+                print()
+        elif self.verbose:
+            # run the graph in ~10 chunks so the loss history only syncs to
+            # the host between progress prints, not every iteration
+            done = 0
+            while done < self.n_iter:
+                chunk = min(max(self.n_iter // 10, 1), self.n_iter - done)
+                losses = self._train_graph(tf.constant(chunk, dtype=tf.int32))
+                self.loss_history.extend(losses.numpy().tolist())
+                done += chunk
                 utils.progress(
-                    (i / self.n_iter) * 100,
+                    (done / self.n_iter) * 100,
                     metric="loss",
                     metricValue=self.loss_history[-1],
                 )
-        if self.verbose:
-            utils.progress(100)
             print()
+        else:
+            losses = self._train_graph(tf.constant(self.n_iter, dtype=tf.int32))
+            self.loss_history.extend(losses.numpy().tolist())
 
     def get_best(self):
         """Return the *g-best*, the particle with best results after the training.
         Returns:
-            tf.Tensor: the best particle of the swarm.
+            tuple: the weights and biases of the best particle of the swarm.
         """
-        return utils.decode(self.g, self.layer_sizes)
+        num_w = len(self.layer_sizes) - 1
+        return self.g[:num_w], self.g[num_w:]
 
     def get_swarm(self):
-        """Return the swarm.
+        """Return the swarm, flattened back to one row per particle. The flat
+        view is only built here, never during training.
         Returns:
-            tf.Tensor: The positions of each particle.
+            tf.Tensor: The positions of each particle, of shape `[pop_size, dim]`.
         """
-        return self.x
+        return tf.concat(
+            [tf.reshape(x_l, [self.pop_size, -1]) for x_l in self.x], axis=1
+        )
 
 
 def main():
@@ -183,22 +387,29 @@ def main():
     x_max = 1
     sample_size = 512
     noise = 0.0
+    gd_alpha = 1e-4
 
     def objective(x, noise=0):
         return tf.cos(math.pi * x) - x
 
-    def get_loss(X, y):
+    def get_loss(X, y, gd_alpha):
         def _loss(w, b):
             with tf.GradientTape() as tape:
                 tape.watch(w)
                 tape.watch(b)
-                pred = utils.multilayer_perceptron(w, b, X)
-                loss = tf.reduce_mean((y - pred) ** 2)
+                pred = utils.multilayer_perceptron_batch(w, b, X)
+                loss = tf.reduce_mean((y - pred) ** 2, axis=[1, 2])
             trainable_variables = w + b
-            grads = tape.gradient(loss, trainable_variables)
+            # particles don't cross-couple, so differentiating the summed
+            # loss recovers each particle's own gradient exactly
+            grads = tape.gradient(tf.reduce_sum(loss), trainable_variables)
             return loss, grads
 
-        return _loss
+        def _loss_no_grads(w, b):
+            pred = utils.multilayer_perceptron_batch(w, b, X)
+            return tf.reduce_mean((y - pred) ** 2, axis=[1, 2])
+
+        return _loss if gd_alpha != 0 else _loss_no_grads
 
     X = tf.reshape(
         tf.Variable(np.linspace(x_min, x_max, sample_size), dtype="float32"),
@@ -209,16 +420,17 @@ def main():
     X, y = utils.normalize(X, [x_min, x_max]), utils.normalize(y, [y_min, y_max])
 
     opt = pso(
-        get_loss(X, y),
+        get_loss(X, y, gd_alpha),
         layers,
         n_iter,
         pop_size,
         0.9,
         0.8,
         0.5,
-        gd_alpha=1e-4,
+        gd_alpha=gd_alpha,
         x_min=x_min,
         x_max=x_max,
+        seed=42,
         verbose=True,
     )
 
@@ -0,0 +1,185 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _pso_update(x, v, p, g, grads, b, c1, c2, gd_alpha, r1, r2):
+    """The PSO velocity/position update as a compiled kernel. Updates `x` and
+    `v` in place, parallelized over the particles.
+    Args:
+        x (np.ndarray): The particle positions, of shape `[pop_size, dim]`.
+        v (np.ndarray): The particle velocities, of shape `[pop_size, dim]`.
+        p (np.ndarray): The *p-best* positions, of shape `[pop_size, dim]`.
+        g (np.ndarray): The *g-best* position, of shape `[dim]`.
+        grads (np.ndarray): The gradients at the current positions, of shape `[pop_size, dim]`.
+        b (float): Inertia of the particles.
+        c1 (float): The *p-best* coeficient.
+        c2 (float): The *g-best* coeficient.
+        gd_alpha (float): Learning rate for gradient descent.
+        r1 (np.ndarray): Uniform randoms for the cognitive term, of shape `[pop_size, dim]`.
+        r2 (np.ndarray): Uniform randoms for the social term, of shape `[pop_size, dim]`.
+    """
+    for i in prange(x.shape[0]):
+        for j in range(x.shape[1]):
+            v[i, j] = (
+                b * v[i, j]
+                + c1 * r1[i, j] * (p[i, j] - x[i, j])
+                + c2 * r2[i, j] * (g[j] - x[i, j])
+                - gd_alpha * grads[i, j]
+            )
+            x[i, j] += v[i, j]
+
+
+class pso_numpy:
+    def __init__(
+        self,
+        fitness_fn,
+        dim,
+        n_iter=2000,
+        pop_size=30,
+        b=0.9,
+        c1=0.8,
+        c2=0.5,
+        x_min=-1,
+        x_max=1,
+        gd_alpha=0.00,
+        cold_start=True,
+        verbose=False,
+    ):
+        """The Particle Swarm Optimizer on a pure NumPy + Numba backend. For
+        CPU runs with small swarms the update arithmetic is trivial, so this
+        backend avoids the per-op graph dispatch of the tensorflow path
+        entirely. The fitness function works on raw arrays.
+        Args:
+            fitness_fn (function): The fitness function for PSO. It receives the whole swarm as a `[pop_size, dim]` array and returns the per-particle losses of shape `[pop_size]` and the gradients of shape `[pop_size, dim]` (or `None` for gradient-free fitness).
+            dim (int): The number of optimizable variables per particle.
+            n_iter (int, optional): Number of PSO iterations. Defaults to 2000.
+            pop_size (int, optional): Population of the PSO swarm. Defaults to 30.
+            b (float, optional): Inertia of the particles. Defaults to 0.9.
+            c1 (float, optional): The *p-best* coeficient. Defaults to 0.8.
+            c2 (float, optional): The *g-best* coeficient. Defaults to 0.5.
+            x_min (int, optional): The min value for the position generation. Defaults to -1.
+            x_max (int, optional): The max value for the position generation. Defaults to 1.
+            gd_alpha (float, optional): Learning rate for gradient descent. Defaults to 0.00, so there wouldn't have any gradient-based optimization.
+            cold_start (bool, optional): Set the starting velocities to 0. Defaults to True.
+            verbose (bool, optional): Shows info during the training . Defaults to False.
+        """
+        self.fitness_fn = fitness_fn
+        self.dim = dim
+        self.n_iter = n_iter
+        self.pop_size = pop_size
+        self.b = b
+        self.c1 = c1
+        self.c2 = c2
+        self.x_min = x_min
+        self.x_max = x_max
+        self.gd_alpha = gd_alpha
+        self.cold_start = cold_start
+        self.verbose = verbose
+        self.x = np.random.uniform(x_min, x_max, [pop_size, dim]).astype(np.float32)
+        self.p = self.x.copy()
+        self.loss_history = []
+        f_p, grads = self.fitness_fn(self.p)
+        self.f_p = f_p.astype(np.float32)
+        self.grads = (
+            np.zeros_like(self.x) if grads is None else grads.astype(np.float32)
+        )
+        self.g = self.p[np.argmin(self.f_p)].copy()
+        self.v = self.start_velocities()
+        self.name = "PSO" if self.gd_alpha == 0 else "PSO-GD"
+
+    def start_velocities(self):
+        """Start the velocities of each particle in the population (swarm). If 'self.cold_start' is 'TRUE', the swarm starts with velocity 0, which means stopped.
+        Returns:
+            np.ndarray: The starting velocities.
+        """
+        if self.cold_start:
+            return np.zeros_like(self.x)
+        else:
+            return np.random.uniform(
+                -self.x_max - self.x_min,
+                self.x_max - self.x_min,
+                [self.pop_size, self.dim],
+            ).astype(np.float32)
+
+    def step(self):
+        """It runs ONE step on the particle swarm optimization."""
+        r = np.random.uniform(0.0, 1.0, [2, self.pop_size, self.dim]).astype(
+            np.float32
+        )
+        _pso_update(
+            self.x,
+            self.v,
+            self.p,
+            self.g,
+            self.grads,
+            np.float32(self.b),
+            np.float32(self.c1),
+            np.float32(self.c2),
+            np.float32(self.gd_alpha),
+            r[0],
+            r[1],
+        )
+        f_x, grads = self.fitness_fn(self.x)
+        if grads is not None:
+            self.grads = grads.astype(np.float32)
+        improved = f_x < self.f_p
+        self.p[improved] = self.x[improved]
+        self.f_p[improved] = f_x[improved]
+        self.g = self.p[np.argmin(self.f_p)].copy()
+        self.loss_history.append(float(f_x.mean()))
+
+    def train(self):
+        """The particle swarm optimization. The PSO will optimize the fitness over the swarm positions."""
+        for i in range(self.n_iter):
+            self.step()
+            if self.verbose and i % (self.n_iter / 10) == 0:
+                print(
+                    f"\r{(i / self.n_iter) * 100:.0f}%  --  "
+                    f"Current loss: {self.loss_history[-1]}",
+                    end="",
+                    flush=True,
+                )
+        if self.verbose:
+            print()
+
+    def get_best(self):
+        """Return the *g-best*, the particle with best results after the training.
+        Returns:
+            np.ndarray: the best particle of the swarm.
+        """
+        return self.g
+
+    def get_swarm(self):
+        """Return the swarm.
+        Returns:
+            np.ndarray: The positions of each particle.
+        """
+        return self.x
+
+
+def main():
+    import time
+
+    np.random.seed(42)
+
+    dim = 30
+    pop_size = 100
+    n_iter = 2000
+
+    def fitness(x):
+        return np.square(x).sum(axis=1), None
+
+    opt = pso_numpy(fitness, dim, n_iter, pop_size, verbose=True)
+
+    start = time.time()
+    opt.train()
+    end = time.time()
+    print("\nTime elapsed: ", end - start)
+    print("Best fitness: ", np.square(opt.get_best()).sum())
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -78,21 +78,42 @@ def decode(encoded, layers):
     Returns:
         tuple: Two `tf.Tensor` representing the weights and biases of a neural net.
     """
-    weights = []
-    biases = []
-    last_cut = 0
     num_layers = len(layers)
-    for l in range(0, num_layers - 1):
-        next_cut = layers[l] * layers[l + 1]
-        W = tf.reshape(
-            tf.slice(encoded, [last_cut], [next_cut]), [layers[l], layers[l + 1]]
-        )
-        last_cut = last_cut + next_cut
-        weights.append(W)
-    for l in range(1, num_layers):
-        b = tf.slice(encoded, [last_cut], [layers[l]])
-        last_cut += layers[l]
-        biases.append(b)
+    w_sizes = [layers[l] * layers[l + 1] for l in range(num_layers - 1)]
+    b_sizes = [layers[l] for l in range(1, num_layers)]
+    parts = tf.split(encoded, w_sizes + b_sizes)
+    weights = [
+        tf.reshape(parts[l], [layers[l], layers[l + 1]])
+        for l in range(num_layers - 1)
+    ]
+    biases = parts[num_layers - 1 :]
+    return weights, biases
+
+
+def decode_batch(encoded, layers):
+    """Decodes the whole PSO swarm at once into batched weights and biases. It
+    is the batched counterpart of the `decode` function: every output tensor
+    keeps the population as its leading dimension.
+    Args:
+        encoded (tf.Tensor): The PSO swarm of shape `[pop_size, dim]`.
+        layers (list): List of 'int' representing the size of each layer.
+    Returns:
+        tuple: Two lists of `tf.Tensor` with the batched weights (shape
+        `[pop_size, in, out]`) and biases (shape `[pop_size, 1, out]`).
+    """
+    pop_size = encoded.shape[0]
+    num_layers = len(layers)
+    w_sizes = [layers[l] * layers[l + 1] for l in range(num_layers - 1)]
+    b_sizes = [layers[l] for l in range(1, num_layers)]
+    parts = tf.split(encoded, w_sizes + b_sizes, axis=1)
+    weights = [
+        tf.reshape(parts[l], [pop_size, layers[l], layers[l + 1]])
+        for l in range(num_layers - 1)
+    ]
+    biases = [
+        tf.reshape(parts[num_layers - 1 + l], [pop_size, 1, layers[l + 1]])
+        for l in range(num_layers - 1)
+    ]
     return weights, biases
 
 
@@ -119,6 +140,36 @@ def multilayer_perceptron(weights, biases, X, x_min=-1, x_max=1):
     return Y
 
 
+def multilayer_perceptron_batch(weights, biases, X, x_min=-1, x_max=1, mixed_precision=False):
+    """It runs the multilayer perceptron for the whole swarm at once. Given
+    the batched weights and biases of all the neural networks and the input
+    `X`, every layer is a single batched `einsum` over the population, so the
+    particle and sample axes are covered by one matmul instead of `pop_size`
+    tiny ones.
+    Args:
+        weights (list): The batched weights, each of shape `[pop_size, in, out]`.
+        biases (list): The batched biases, each of shape `[pop_size, 1, out]`.
+        X (tf.Tensor): The input values of shape `[sample_size, in]`.
+        x_min (int, optional): The floor value for the normalization. Defaults to -1.
+        x_max (int, optional): The roof value for the normalization. Defaults to 1.
+        mixed_precision (bool, optional): Run the layers in `bfloat16` and cast the predictions back to `float32`. Halves the activation bandwidth and uses the fast matmul path on hardware with bf16 support, while the PSO state stays in `float32`. Defaults to False.
+    Returns:
+        tf.Tensor: The predictions `Y` of shape `[pop_size, sample_size, out]`.
+    """
+    H = 2.0 * (X - x_min) / (x_max - x_min) - 1.0
+    if mixed_precision:
+        H = tf.cast(H, tf.bfloat16)
+        weights = [tf.cast(W, tf.bfloat16) for W in weights]
+        biases = [tf.cast(b, tf.bfloat16) for b in biases]
+    H = tf.einsum("bi,pio->pbo", H, weights[0]) + biases[0]
+    for l in range(1, len(weights)):
+        H = tf.nn.tanh(H)
+        H = tf.einsum("pbi,pio->pbo", H, weights[l]) + biases[l]
+    if mixed_precision:
+        H = tf.cast(H, tf.float32)
+    return H
+
+
 def replacenan(t):
     """Replace `nan` with zeros. **CAUTION**: `nan` may be the result of an infinitely small number, but it could happen the other way around too. If the `nan` was the result of an infinitely big number, the zero representation would be misleading.
     Args: